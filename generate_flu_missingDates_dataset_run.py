@@ -61,7 +61,7 @@ if __name__ == "__main__":
     RUN_BEAST = True
     RUN_TREETIME = True
 
-    print sys.argv[0]
+    print (sys.argv[0])
 
     out_dir = sys.argv[1]
     subtree = sys.argv[2]
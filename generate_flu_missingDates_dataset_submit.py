@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import subprocess as sp
 import os
+from utility_functions_cluster import submit_array_job
 
 CLUSTER = True
 
@@ -20,29 +21,29 @@ if __name__ =="__main__":
     #dates_knonwn_fraction = [0.5]
     #Npoints = 1
 
+    # (subtree, fraction, filename suffix) triple for every run
+    params = []
     for subtree in subtree_files:
         for frac in dates_knonwn_fraction:
-            for point in xrange(Npoints):
-
-                if CLUSTER:
-                    call = ['qsub', '-cwd', '-b','y',
-                         '-l', 'h_rt=23:59:0',
-                         #'-o', './stdout.txt',
-                         #'-e', './stderr.txt',
-                         '-l', 'h_vmem=50G',
-                         './generate_flu_missingDates_dataset_run.py']
-                else:
-                    call = ['./generate_flu_missingDates_dataset_run.py']
-
-                filename_suffix = "_Nk{}_{}".format(frac,point)
-
-                arguments = [
-                        out_dir,
-                        subtree,
-                        str(frac),
-                        filename_suffix
-                        ]
-                call.extend(arguments)
-                sp.call(call)
-
-
+            # the fraction does not change over the points
+            frac = str(frac)
+            suffix_prefix = "_Nk{}_".format(frac)
+            for point in range(Npoints):
+                params.append((subtree, frac, suffix_prefix + str(point)))
+
+    if CLUSTER:
+        submit_array_job(out_dir, "missing_dates", params,
+            './generate_flu_missingDates_dataset_run.py {} "$1" "$2" "$3"'.format(out_dir))
+
+    else:
+        base_call = ['./generate_flu_missingDates_dataset_run.py', out_dir]
+        for subtree, frac, filename_suffix in params:
+            call = list(base_call)
+
+            arguments = [
+                    subtree,
+                    frac,
+                    filename_suffix
+                    ]
+            call.extend(arguments)
+            sp.call(call)
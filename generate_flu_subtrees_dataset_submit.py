@@ -3,6 +3,7 @@
 import subprocess as sp
 import numpy as np
 import os
+from utility_functions_cluster import submit_array_job
 
 CLUSTER = True
 
@@ -25,21 +26,21 @@ if __name__ =="__main__":
     #N_leaves_array = [20]
     #n_iter = 1
 
-    for N_leaves in N_leaves_array:
-        for iteration in np.arange(n_iter):
-            subtree_fname_suffix = str(iteration)
+    # (N_leaves, iteration) pair for every run
+    params = [(N_leaves, iteration)
+              for N_leaves in N_leaves_array
+              for iteration in np.arange(n_iter)]
 
-            if CLUSTER:
-                call = ['qsub', '-cwd', '-b','y',
-                        '-l', 'h_rt=23:59:0',
-                        #'-o', './stdout.txt',
-                        #'-e', './stderr.txt',
-                        '-l', 'h_vmem=50G',
-                        './generate_flu_subtrees_dataset_run.py']
+    if CLUSTER:
+        submit_array_job(work_dir, "subtree", params,
+            './generate_flu_subtrees_dataset_run.py "$1" {} "$2" {} {} {}'.format(
+                out_dir, treetime_res_file, lsd_res_file, beast_res_file))
 
-            else:
-                call = ['./generate_flu_subtrees_dataset_run.py']
+    else:
+        for N_leaves, iteration in params:
+            subtree_fname_suffix = str(iteration)
 
+            call = ['./generate_flu_subtrees_dataset_run.py']
 
             arguments = [
                 str(N_leaves),
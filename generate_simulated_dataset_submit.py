@@ -12,6 +12,19 @@ commented, which can be used to perform computations on a local machine.
 import sys, os
 import subprocess as sp
 sys.path.append("./")
+from utility_functions_cluster import JOB_LOG
+
+# maximal number of the qsub submissions in flight
+MAX_PENDING = 32
+
+def _wait_submission(proc):
+    """
+    Wait for the submission process to finish and forward its output (job id
+    as reported by the scheduler) to the terminal
+    """
+    out, err = proc.communicate()
+    sys.stdout.write(out)
+    sys.stderr.write(err)
 
 if __name__ == '__main__':
 
@@ -36,11 +49,22 @@ if __name__ == '__main__':
     #MUS = [2e-4]
     #N_POINTS = 1
 
+    if CLUSTER:
+        base_call = ['qsub', '-cwd', '-b','y',
+                     '-l', 'h_rt=23:59:0', # BEAST might run long
+                     '-o', JOB_LOG,
+                     '-e', JOB_LOG,
+                     '-l', 'h_vmem=50G', # BEAST requires A LOT
+                     './generate_simulated_dataset_run.py']
+    else:
+        base_call = ['./generate_simulated_dataset_run.py']
+
     # run treetime in-place:
     Ncalls = 0
+    pending = []
     for MU in MUS:
         for SAMPLE_FREQ in SAMPLE_FREQS:
-            for i in xrange(N_0, N_0 + N_POINTS):
+            for i in range(N_0, N_0 + N_POINTS):
                 suffix = str(i)
 
                 Ncalls += 1
@@ -48,15 +72,7 @@ if __name__ == '__main__':
                     print ("Number of jobs exceeded")
                     break
 
-                if CLUSTER:
-                    call = ['qsub', '-cwd', '-b','y',
-                           '-l', 'h_rt=23:59:0', # BEAST might run long
-                              #'-o', './stdout.txt',
-                              #'-e', './stderr.txt',
-                            '-l', 'h_vmem=50G', # BEAST requires A LOT
-                             './generate_simulated_dataset_run.py']
-                else:
-                    call = ['./generate_simulated_dataset_run.py']
+                call = list(base_call)
 
                 # run computations on a cluster
 
@@ -71,4 +87,16 @@ if __name__ == '__main__':
                             outfile]
                 call.extend(arguments)
 
-                sp.call(call)
+                if CLUSTER:
+                    # qsub returns as soon as the job is queued, so do not
+                    # block on every submission, but keep a bounded number of
+                    # them in flight
+                    pending.append(sp.Popen(call, stdout=sp.PIPE, stderr=sp.PIPE,
+                                            close_fds=True, universal_newlines=True))
+                    if len(pending) >= MAX_PENDING:
+                        _wait_submission(pending.pop(0))
+                else:
+                    sp.call(call)
+
+    for proc in pending:
+        _wait_submission(proc)
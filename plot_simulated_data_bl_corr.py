@@ -19,7 +19,7 @@ import os, sys
 import pandas
 from Bio import Phylo
 import dendropy
-import StringIO
+from io import StringIO
 
 import utility_functions_beast as beast_utils
 import utility_functions_simulated_data as sim_utils
@@ -48,9 +48,9 @@ def corr_points(basename, beast_dir=None):
 
         trees = dendropy.TreeList.get_from_path(beast_file, schema="nexus")
         tree = trees[-1]
-        out = StringIO.StringIO()
+        out = StringIO()
         tree.write_to_stream(out, 'newick')
-        biotree = Phylo.read(StringIO.StringIO(out.getvalue()), 'newick')
+        biotree = Phylo.read(StringIO(out.getvalue()), 'newick')
         return biotree
 
     def basename_to_beast_file(basename, beast_dir):
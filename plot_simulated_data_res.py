@@ -31,12 +31,7 @@ def read_treetime_results_dataset(fname):
 
     # some very basic preprocessing
     df['dTmrca'] = -(df['Sim_Tmrca'] - df['Tmrca'])
-    df['Sim_mu'] = map(lambda x: float(x.split("/")[-1].split('_')[6][2:]), df.File)
-    df['Ns'] = map(lambda x: int(x.split("/")[-1].split('_')[3][2:]), df.File)
-    df['Ts'] = map(lambda x: int(x.split("/")[-1].split('_')[4][2:]), df.File)
-    df['N'] = map(lambda x: int(x.split("/")[-1].split('_')[2][1:]), df.File)
-    df['T'] = df['Ns']*df['Ts']
-    df['Nmu'] = (df['N']*df['Sim_mu'])
+    df = sim_utils.parse_simulation_parameters(df)
 
     return df
 
@@ -59,12 +54,7 @@ def read_lsd_results_dataset(fname):
 
     #Some basic preprocessing
     df['dTmrca'] = -(df['Sim_Tmrca'] - df['Tmrca'])
-    df['Sim_mu'] = map(lambda x: float(x.split("/")[-1].split('_')[6][2:]), df.File)
-    df['Ns'] = map(lambda x: int(x.split("/")[-1].split('_')[3][2:]), df.File)
-    df['Ts'] = map(lambda x: int(x.split("/")[-1].split('_')[4][2:]), df.File)
-    df['N'] = map(lambda x: int(x.split("/")[-1].split('_')[2][1:]), df.File)
-    df['T'] = df['Ns']*df['Ts']
-    df['Nmu'] = (df['N']*df['Sim_mu'])
+    df = sim_utils.parse_simulation_parameters(df)
 
     return df
 
@@ -75,27 +65,28 @@ def create_lsd_tt_pivot(df, T_over_N=None, mean_or_median='median'):
     else:
         DF = df
 
-    N_MUS = np.unique(DF.Nmu)
-    N_MUS_idxs = np.ones(N_MUS.shape, dtype=bool)
+    # sort the N*mu values once, each group is then a contiguous slice
+    key = DF.Nmu.values
+    order = np.argsort(key, kind='mergesort')
+    N_MUS, starts = np.unique(key[order], return_index=True)
+    ends = np.r_[starts[1:], len(key)]
 
     mu_mean = []
     mu_err = []
     tmrca_mean = []
     tmrca_err = []
 
-    for idx, N_MU  in enumerate(N_MUS):
-        idxs = DF.Nmu == N_MU
-        if idxs.sum() == 0:
-            N_MUS_idxs[idx] = False
-            continue
+    for start, end in zip(starts, ends):
+        rows = order[start:end]
 
 #        import ipdb; ipdb.set_trace()
-        dMu = -(DF.Sim_mu[idxs] - DF.mu[idxs])/DF.Sim_mu[idxs]
-        dMu.sort_values(inplace=True)
+        sim_mu = DF.Sim_mu.values[rows]
+        dMu = (DF.mu.values[rows] - sim_mu)/sim_mu
+        dMu.sort()
         #dMu = dMu[int(dMu.shape[0]*0.05) : int(dMu.shape[0]*0.95)]
 
-        dTmrca = DF.dTmrca[idxs]/DF.N[idxs]
-        dTmrca.sort_values(inplace=True)
+        dTmrca = DF.dTmrca.values[rows]/DF.N.values[rows]
+        dTmrca.sort()
         #dTmrca = dTmrca[int(dTmrca.shape[0]*0.05) : int(dTmrca.shape[0]*0.95)]
 
         if mean_or_median == "mean":
@@ -114,7 +105,7 @@ def create_lsd_tt_pivot(df, T_over_N=None, mean_or_median='median'):
 
 
     res = pandas.DataFrame({
-        "Nmu" : N_MUS[N_MUS_idxs],
+        "Nmu" : N_MUS,
         "dMu_mean" : mu_mean,
         "dMu_err" : mu_err,
         "dTmrca_mean" : tmrca_mean,
@@ -285,22 +276,22 @@ def create_beast_log_pivot(df, T_over_N=None):
     tmrca_mean = []
     tmrca_err = []
 
-    N_MUS = np.unique(DF.Nmu)
-    N_MUS_idxs = np.ones(N_MUS.shape, dtype=bool)
-
-    for idx, N_MU  in enumerate(N_MUS):
+    # sort the N*mu values once, each group is then a contiguous slice
+    key = DF.Nmu.values
+    order = np.argsort(key, kind='mergesort')
+    N_MUS, starts = np.unique(key[order], return_index=True)
+    ends = np.r_[starts[1:], len(key)]
 
-        idxs = DF.Nmu == N_MU
-        if idxs.sum() == 0:
-            N_MUS_idxs[idx] = False
-            continue
+    for start, end in zip(starts, ends):
 
-        dMu = -(DF.Sim_Mu[idxs] - DF.Mu[idxs])/DF.Sim_Mu[idxs]
-        dMu.sort_values(inplace=True)
+        rows = order[start:end]
+        sim_mu = DF.Sim_Mu.values[rows]
+        dMu = (DF.Mu.values[rows] - sim_mu)/sim_mu
+        dMu.sort()
         dMu[int(dMu.shape[0]*0.05) : int(dMu.shape[0]*0.95)]
 
-        dTmrca = DF.dTmrca[idxs]/DF.N[idxs]
-        dTmrca.sort_values(inplace=True)
+        dTmrca = DF.dTmrca.values[rows]/DF.N.values[rows]
+        dTmrca.sort()
         dTmrca = dTmrca[int(dTmrca.shape[0]*0.05) : int(dTmrca.shape[0]*0.95)]
 
         if mean_or_median == "mean":
@@ -318,7 +309,7 @@ def create_beast_log_pivot(df, T_over_N=None):
             tmrca_mean.append(np.median(dTmrca))
 
     res = pandas.DataFrame({
-        "Nmu" : N_MUS[N_MUS_idxs],
+        "Nmu" : N_MUS,
         "dMu_mean" : mu_mean,
         "dMu_err" : mu_err,
         "dTmrca_mean" : tmrca_mean,
@@ -433,12 +424,12 @@ def plot_data_stat(what, axes, beast=None, tt=None, tt_f=None, lsd=None, lsd_f=N
 
 def get_beast_tree_from_file(beast_file):
     import dendropy
-    import StringIO
+    from io import StringIO
     trees = dendropy.TreeList.get(path=beast_file, schema="nexus")
     tree = trees[-1]
-    out = StringIO.StringIO()
+    out = StringIO()
     tree.write_to_stream(out, 'newick')
-    biotree = Phylo.read(StringIO.StringIO(out.getvalue()), 'newick')
+    biotree = Phylo.read(StringIO(out.getvalue()), 'newick')
     return biotree
 
 
@@ -463,12 +454,12 @@ def corr_points(basename, beast_dir=None):
         if beast_file is None:
             return None
         import dendropy
-        import StringIO
+        from io import StringIO
         trees = dendropy.TreeList.get_from_path(beast_file, schema="nexus")
         tree = trees[-1]
-        out = StringIO.StringIO()
+        out = StringIO()
         tree.write_to_stream(out, 'newick')
-        biotree = Phylo.read(StringIO.StringIO(out.getvalue()), 'newick')
+        biotree = Phylo.read(StringIO(out.getvalue()), 'newick')
         return biotree
 
     def basename_to_beast_file(basename, beast_dir):
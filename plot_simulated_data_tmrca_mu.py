@@ -14,6 +14,8 @@ import matplotlib.pyplot as plt
 import matplotlib.cm as mplcm
 import matplotlib.colors as colors
 import os, sys
+import glob
+import tempfile
 import pandas
 from Bio import Phylo
 
@@ -22,6 +24,45 @@ import utility_functions_simulated_data as sim_utils
 
 from plot_defaults import *
 
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional, without it the statistics are computed by plain numpy
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+# number of CSV rows parsed at once. The results of many cluster runs can
+# make the tables large, so only the rows passing the filter are kept in memory
+CSV_CHUNKSIZE = 500000
+
+# version of the parsed tables layout, part of the cache file names:
+# increase it whenever the output of the readers changes
+CACHE_VERSION = 1
+
+def read_filtered_csv(fname, columns, dtypes, row_filter):
+    """
+    Read the CSV file chunk by chunk, keeping only the rows selected by the filter
+
+    Args:
+     - fname: path to the input file
+     - columns: names of the table columns
+     - dtypes: dictionary column name -> column data type
+     - row_filter: function, which takes a chunk of the table and returns the
+     boolean mask of the rows to keep
+
+    Returns:
+     - df: Table of the filtered rows as pandas data-frame
+    """
+
+    chunks = []
+    for chunk in pandas.read_csv(fname, names=columns, header=0, usecols=columns,
+                                 dtype=dtypes, engine='c', chunksize=CSV_CHUNKSIZE):
+        chunks.append(chunk[row_filter(chunk)])
+
+    if len(chunks) == 0:
+        return pandas.DataFrame(columns=columns).astype(dtypes)
+    return pandas.concat(chunks)
+
 def read_treetime_results_csv(fname):
     """
     Read results of the TreeTime simulations
@@ -34,20 +75,16 @@ def read_treetime_results_csv(fname):
     """
 
     columns = ['File', 'Sim_Tmrca', 'Tmrca', 'mu', 'R', 'R2_int']
-    df = pandas.read_csv(fname, names=columns,header=0)
+    dtypes = {'File': 'string', 'Sim_Tmrca': np.float32, 'Tmrca': np.float32,
+              'mu': np.float32, 'R': np.float32, 'R2_int': np.float32}
 
-    #filter obviously failed simulations
-    df = df[[len(str(k)) > 10 for k in df.File]]
-    df = df[df.R > 0.1]
+    #filter obviously failed simulations (missing file names have no length)
+    df = read_filtered_csv(fname, columns, dtypes,
+        lambda ch: (ch['File'].str.len().fillna(0) > 10) & (ch['R'] > 0.1))
 
     # some very basic preprocessing
     df['dTmrca'] = -(df['Sim_Tmrca'] - df['Tmrca'])
-    df['Sim_mu'] = map(lambda x: float(x.split("/")[-1].split('_')[6][2:]), df.File)
-    df['Ns'] = map(lambda x: int(x.split("/")[-1].split('_')[3][2:]), df.File)
-    df['Ts'] = map(lambda x: int(x.split("/")[-1].split('_')[4][2:]), df.File)
-    df['N'] = map(lambda x: int(x.split("/")[-1].split('_')[2][1:]), df.File)
-    df['T'] = df['Ns']*df['Ts']
-    df['Nmu'] = (df['N']*df['Sim_mu'])
+    df = sim_utils.parse_simulation_parameters(df)
 
     return df
 
@@ -63,19 +100,16 @@ def read_lsd_results_csv(fname):
     """
 
     columns = ['File', 'Sim_Tmrca', 'Tmrca', 'mu', 'obj']
-    df = pandas.read_csv(fname, names=columns,header=0)
+    dtypes = {'File': 'string', 'Sim_Tmrca': np.float32, 'Tmrca': np.float32,
+              'mu': np.float32, 'obj': np.float32}
 
     # Filter out obviously wrong data
-    df = df[[len(k) > 10 for k in df.File]]
+    df = read_filtered_csv(fname, columns, dtypes,
+        lambda ch: ch['File'].str.len().fillna(0) > 10)
 
     #Some basic preprocessing
     df['dTmrca'] = -(df['Sim_Tmrca'] - df['Tmrca'])
-    df['Sim_mu'] = map(lambda x: float(x.split("/")[-1].split('_')[6][2:]), df.File)
-    df['Ns'] = map(lambda x: int(x.split("/")[-1].split('_')[3][2:]), df.File)
-    df['Ts'] = map(lambda x: int(x.split("/")[-1].split('_')[4][2:]), df.File)
-    df['N'] = map(lambda x: int(x.split("/")[-1].split('_')[2][1:]), df.File)
-    df['T'] = df['Ns']*df['Ts']
-    df['Nmu'] = (df['N']*df['Sim_mu'])
+    df = sim_utils.parse_simulation_parameters(df)
 
     return df
 
@@ -92,13 +126,92 @@ def read_beast_results_csv(fname):
 
     columns = ['File', 'N', 'Sim_Tmrca', 'Sim_mu', 'Ns', 'Ts', 'T', 'Nmu',
                 'LH', 'LH_std', 'Tmrca', 'Tmrca_std', 'mu', 'mu_std']
-    df = pandas.read_csv(fname, names=columns,header=0)
-    df = df[[len(k) > 10 for k in df.File]]
+    # failed runs leave empty fields: the integer columns are read as floats
+    # and converted only after these rows are filtered out
+    int_columns = ['N', 'Ns', 'Ts', 'T']
+    dtypes = dict([(k, np.float32) for k in columns])
+    dtypes['File'] = 'string'
+    df = read_filtered_csv(fname, columns, dtypes,
+        lambda ch: ch['File'].str.len().fillna(0) > 10)
+    df = df.astype(dict([(k, np.int32) for k in int_columns]))
+    df['Nmu'] = df['Nmu'].round(6).astype(np.float32)
     #import ipdb; ipdb.set_trace()
     df['dTmrca'] = -(df['Sim_Tmrca'] - df['Tmrca'])
     return df
 
-def create_pivot_table(df, T_over_N=None, mean_or_median='median'):
+def cached_read(fname, reader):
+    """
+    Read the results table with the given reader, caching the parsed dataframe
+    in a Parquet file next to the CSV. The cache file name includes the reader,
+    the CACHE_VERSION, and the modification time and the size of the CSV, so
+    the cache is rebuilt whenever the CSV or the reader output changes, and
+    the outdated caches are removed. If pyarrow is not available, the CSV is parsed on every call.
+
+    Args:
+     - fname: path to the input CSV file
+     - reader: function to read the CSV file, e.g. read_treetime_results_csv
+
+    Returns:
+     - df: Table of results as pandas data-frame
+    """
+
+    stat = os.stat(fname)
+    cache = "{}.{}.v{}.{}.{}.parquet".format(fname, reader.__name__, CACHE_VERSION,
+                                            stat.st_mtime_ns, stat.st_size)
+    if os.path.exists(cache):
+        try:
+            return pandas.read_parquet(cache, engine='pyarrow')
+        except Exception:
+            # truncated or otherwise broken cache: rebuild it from the CSV
+            pass
+
+    df = reader(fname)
+    # write to a temporary file first, so that a concurrent or interrupted
+    # run never leaves a partial cache under the final name
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(cache) + '.',
+                               suffix='.tmp', dir=os.path.dirname(cache) or '.')
+    os.close(fd)
+    try:
+        df.to_parquet(tmp, engine='pyarrow', compression='zstd',
+                      use_dictionary=['File'])
+        os.replace(tmp, cache)
+    except ImportError:
+        return df
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    # remove the caches left over from the older versions of the CSV or reader
+    for old_cache in glob.glob("{}.{}.*.parquet".format(glob.escape(fname), reader.__name__)):
+        if old_cache != cache:
+            os.remove(old_cache)
+    return df
+
+@njit(cache=True)
+def _sorted_quantile(a, q):
+    """
+    Quantile of the sorted array, linearly interpolated as in np.percentile
+    """
+    pos = q * (a.shape[0] - 1)
+    lo = int(pos)
+    hi = min(lo + 1, a.shape[0] - 1)
+    return a[lo] + (a[hi] - a[lo]) * (pos - lo)
+
+@njit(cache=True)
+def _sorted_summary(a):
+    """
+    Median, 25% and 75% quantiles, mean and standard deviation of the sorted
+    array without NaNs. The distribution is already sorted, so no selection is
+    needed.
+    """
+    if a.shape[0] == 0:
+        return np.nan, np.nan, np.nan, np.nan, np.nan
+    mean = a.mean()
+    std = np.sqrt(((a - mean)**2).mean())
+    return (_sorted_quantile(a, 0.5), _sorted_quantile(a, 0.25),
+            _sorted_quantile(a, 0.75), mean, std)
+
+def create_pivot_table(df, T_over_N=None, mean_or_median='median', trim=None):
     """
     Create the pivot table to plot from the raw dataframe.
     Args:
@@ -129,6 +242,10 @@ def create_pivot_table(df, T_over_N=None, mean_or_median='median'):
          the standard deviation
          - 'median': datapoint is the median of the distribution, the errorbars are
          quinatiles.
+
+     - trim(float or None): if not None, the fraction of the datapoints to be
+     dropped from each tail of the distribution (e.g. 0.05 leaves the 5%-95%
+     range) before the statistics are calculated.
     """
 
     if T_over_N is not None:
@@ -136,64 +253,104 @@ def create_pivot_table(df, T_over_N=None, mean_or_median='median'):
     else:
         DF = df
 
-    N_MUS = np.unique(DF.Nmu)
-    N_MUS_idxs = np.ones(N_MUS.shape, dtype=bool)
-
-    mu_mean = []
-    mu_err = []
-    tmrca_mean = []
-    tmrca_err = []
-
-    for idx, N_MU  in enumerate(N_MUS):
-        idxs = DF.Nmu == N_MU
-        if idxs.sum() == 0:
-            N_MUS_idxs[idx] = False
-            continue
-
-        dMu = -(DF.Sim_mu[idxs] - DF.mu[idxs])/DF.Sim_mu[idxs]
-        dMu.sort_values(inplace=True)
-        #dMu = dMu[int(dMu.shape[0]*0.05) : int(dMu.shape[0]*0.95)]
+    res_columns = ["Nmu", "dMu_mean", "dMu_err", "dTmrca_mean", "dTmrca_err"]
+    if DF.shape[0] == 0:
+        # nothing to group, e.g. no simulations with the requested T/N
+        return pandas.DataFrame(columns=res_columns, dtype=float)
+
+    # relative errors of the reconstruction, grouped by the N*mu value
+    DF = DF.assign(dMu=-(DF.Sim_mu - DF.mu)/DF.Sim_mu,
+                   dTmrca_n=DF.dTmrca/DF.N)
+    cols = ['dMu', 'dTmrca_n']
+
+    if trim:
+        # the tails are cut from every group separately: sort the table once
+        # by N*mu, so that each group is a contiguous slice of it
+        DF = DF.sort_values('Nmu', kind='mergesort').reset_index(drop=True)
+        key = DF['Nmu'].values
+        N_MUS, starts = np.unique(key, return_index=True)
+        ends = np.r_[starts[1:], len(key)]
+
+        mean_vals = np.empty((N_MUS.shape[0], len(cols)))
+        err_vals = np.empty((N_MUS.shape[0], len(cols)))
+        for idx, (start, end) in enumerate(zip(starts, ends)):
+            sub = DF.iloc[start:end]
+            for jdx, col in enumerate(cols):
+                # plain numpy sort of the (copied) values without NaNs, no index
+                # to maintain
+                vals = sub[col].values.astype(np.float32)
+                vals = vals[~np.isnan(vals)]
+                vals.sort()
+                vals = vals[int(vals.shape[0]*trim) : int(vals.shape[0]*(1 - trim))]
+                median, q25, q75, mu, std = _sorted_summary(vals)
+                if mean_or_median == "mean":
+                    mean_vals[idx, jdx] = mu
+                    err_vals[idx, jdx] = std
+                else:
+                    mean_vals[idx, jdx] = median
+                    err_vals[idx, jdx] = q75 - q25
+
+        mean = pandas.DataFrame(mean_vals, index=N_MUS, columns=cols)
+        err = pandas.DataFrame(err_vals, index=N_MUS, columns=cols)
 
-        dTmrca = DF.dTmrca[idxs]/DF.N[idxs]
-        dTmrca.sort_values(inplace=True)
-        #dTmrca = dTmrca[int(dTmrca.shape[0]*0.05) : int(dTmrca.shape[0]*0.95)]
+    else:
+        groups = DF.groupby('Nmu')[cols]
 
         if mean_or_median == "mean":
-            mu_mean.append(np.mean(dMu))
-            mu_err.append(np.std(dMu))
-
-            tmrca_mean.append(np.mean(dTmrca))
-            tmrca_err.append(np.std(dTmrca))
+            mean = groups.mean()
+            err = groups.std(ddof=0)
         else:
-            q75, q25 = np.percentile(dMu, [75 ,25])
-            mu_err.append((q75 - q25)) #np.std(DF.dTmrca[idxs])
-            mu_mean.append(np.median(dMu))
-            q75, q25 = np.percentile(dTmrca, [75 ,25])
-            tmrca_err.append((q75 - q25)) #np.std(DF.dTmrca[idxs])
-            tmrca_mean.append(np.median(dTmrca))
-
+            # all three quantiles of every group in one pass
+            quantiles = groups.quantile([0.25, 0.5, 0.75])
+            mean = quantiles.xs(0.5, level=1)
+            err = quantiles.xs(0.75, level=1) - quantiles.xs(0.25, level=1)
 
     res = pandas.DataFrame({
-        "Nmu" : N_MUS[N_MUS_idxs],
-        "dMu_mean" : mu_mean,
-        "dMu_err" : mu_err,
-        "dTmrca_mean" : tmrca_mean,
-        "dTmrca_err" : tmrca_err,
+        "Nmu" : mean.index.values,
+        "dMu_mean" : mean['dMu'].values,
+        "dMu_err" : err['dMu'].values,
+        "dTmrca_mean" : mean['dTmrca_n'].values,
+        "dTmrca_err" : err['dTmrca_n'].values,
         })
     res = res.sort_values(by='Nmu')
     return res
 
-def plot_simulated_data(Tmrca_or_Mu,
+def pivot_to_arrays(pivot):
+    """
+    Convert the pivot table to the dictionary of numpy arrays (one per column)
+    as used by the plot_simulated_data function.
+
+    Args:
+     - pivot (pandas.DataFrame or None): pivot table as created by the
+     create_pivot_table function
+
+    Returns:
+     - arrays (dict or None): column name -> numpy array of the column values
+    """
+
+    if pivot is None:
+        return None
+    return dict([(col, pivot[col].values) for col in pivot.columns])
+
+def plot_simulated_data(Tmrca_or_Mu, axes,
     treetime_pivot=None, lsd_pivot=None, beast_pivot=None,
-    figname=None, plot_idxs=None):
+    plot_idxs=None, x_shifted=None):
     """
-    TODO
+    Plot the Tmrca or the clock rate reconstruction errors vs. the diversity
+    into the given axes. The pivots are the dictionaries of numpy arrays, as
+    returned by the pivot_to_arrays function, so that the same arrays can be
+    reused for both plots.
+
+    The TreeTime and LSD points are shifted along the x axis by a fraction of
+    the markersize. The shift depends on the x axis only, so the shifted
+    positions returned for one plot (x_shifted) can be passed on to the plot
+    with the same x axis layout to skip the coordinate transforms.
     """
 
     from plot_defaults import shift_point_by_markersize
 
-    fig = plt.figure(figsize=onecolumn_figsize)
-    axes = fig.add_subplot(111)
+    if x_shifted is None:
+        x_shifted = {}
 
     axes.grid('on')
     axes.set_xscale('log')
@@ -219,7 +376,10 @@ def plot_simulated_data(Tmrca_or_Mu,
 
     # Plot treetime
     if treetime_pivot is not None:
-        x, y = shift_point_by_markersize(axes, treetime_pivot["Nmu"], treetime_pivot[mean], +markersize*.75)
+        if 'treetime' not in x_shifted:
+            x_shifted['treetime'], _ = shift_point_by_markersize(axes,
+                treetime_pivot["Nmu"], treetime_pivot[mean], +markersize*.75)
+        x, y = x_shifted['treetime'], treetime_pivot[mean]
 
         if plot_idxs is None:
             tt_plot_idxs = np.ones(x.shape[0] ,dtype=bool)
@@ -228,7 +388,7 @@ def plot_simulated_data(Tmrca_or_Mu,
 
         axes.errorbar(x[tt_plot_idxs],
                       y[tt_plot_idxs],
-                      (treetime_pivot[err].values/2)[tt_plot_idxs],
+                      (treetime_pivot[err]/2)[tt_plot_idxs],
             fmt='-',
             marker='o',
             markersize=markersize,
@@ -240,13 +400,13 @@ def plot_simulated_data(Tmrca_or_Mu,
     # Plot BEAST
     if beast_pivot is not None:
         if plot_idxs is None:
-            beast_plot_idxs = np.ones(beast_pivot.shape[0] ,dtype=bool)
+            beast_plot_idxs = np.ones(beast_pivot["Nmu"].shape[0] ,dtype=bool)
         else:
             beast_plot_idxs = plot_idxs
 
-        axes.errorbar(beast_pivot["Nmu"].loc[beast_plot_idxs].values,
-                      beast_pivot[mean].loc[beast_plot_idxs].values,
-                      beast_pivot[err].loc[beast_plot_idxs].values,
+        axes.errorbar(beast_pivot["Nmu"][beast_plot_idxs],
+                      beast_pivot[mean][beast_plot_idxs],
+                      beast_pivot[err][beast_plot_idxs],
             marker='o',
             markersize=markersize,
             c=beast_color,
@@ -255,7 +415,10 @@ def plot_simulated_data(Tmrca_or_Mu,
 
     # Plot LSD
     if lsd_pivot is not None:
-        x, y = shift_point_by_markersize(axes, lsd_pivot["Nmu"], lsd_pivot[mean], +markersize/2)
+        if 'lsd' not in x_shifted:
+            x_shifted['lsd'], _ = shift_point_by_markersize(axes,
+                lsd_pivot["Nmu"], lsd_pivot[mean], +markersize/2)
+        x, y = x_shifted['lsd'], lsd_pivot[mean]
         if plot_idxs is None:
             lsd_plot_idxs = np.ones(x.shape[0] ,dtype=bool)
         else:
@@ -263,14 +426,14 @@ def plot_simulated_data(Tmrca_or_Mu,
 
         axes.errorbar(x[lsd_plot_idxs],
                       y[lsd_plot_idxs],
-                      (lsd_pivot[err].values/2)[lsd_plot_idxs],
+                      (lsd_pivot[err]/2)[lsd_plot_idxs],
             fmt='-',
             marker='o',
             markersize=markersize,
             c=lsd_color,
             label="LSD")
 
-    plt.hlines(0, 0, 1)
+    axes.hlines(0, 0, 1)
     axes.legend(loc=1,fontsize=legend_fs)
     #axes.set_title(title)
     axes.set_ylabel(ylabel, fontsize = label_fs)
@@ -280,12 +443,10 @@ def plot_simulated_data(Tmrca_or_Mu,
     for label in axes.get_yticklabels():
             label.set_fontsize(tick_fs)
 
-    fig.text(0.15, 0.85, text_overestimated, fontsize=tick_fs)
-    fig.text(0.15, 0.15, text_underestimated, fontsize=tick_fs)
+    axes.text(0.03, 0.93, text_overestimated, fontsize=tick_fs, transform=axes.transAxes)
+    axes.text(0.03, 0.05, text_underestimated, fontsize=tick_fs, transform=axes.transAxes)
 
-    if figname is not None:
-        for fmt in formats:
-            fig.savefig("{}.{}".format(figname, fmt))
+    return x_shifted
 
 
 if __name__ == '__main__':
@@ -318,8 +479,15 @@ if __name__ == '__main__':
     mean_or_median = 'median'
 
     """
-    Should save figures? If True, note the figure name in the plot_simulated_data
-    function parameters.
+    Fraction of the datapoints to be dropped from each tail of the error
+    distributions before the data points and the error bars are calculated
+    (e.g. 0.05 leaves the 5%-95% range of every N*mu value). None keeps all
+    datapoints.
+    """
+    trim = None
+
+    """
+    Should save figures? If True, note the figure name at the end of the script.
     """
     SAVE_FIG = True
 
@@ -335,25 +503,37 @@ if __name__ == '__main__':
     ## Read, process and plot the data
     ##
     # read csv's to the pandas dataframes:
-    treetime_df = read_treetime_results_csv(treetime_csv)
-    lsd_df = read_lsd_results_csv(lsd_csv)
-    beast_df = read_beast_results_csv(beast_csv)
+    treetime_df = cached_read(treetime_csv, read_treetime_results_csv)
+    lsd_df = cached_read(lsd_csv, read_lsd_results_csv)
+    beast_df = cached_read(beast_csv, read_beast_results_csv)
 
     # make pivot tables and filter only the relevant parameters:
-    lsd_pivot = create_pivot_table(lsd_df, T_over_N=T_over_N, mean_or_median=mean_or_median)
-    beast_pivot = create_pivot_table(beast_df, T_over_N=T_over_N, mean_or_median=mean_or_median)
-    treetime_pivot = create_pivot_table(treetime_df, T_over_N=T_over_N, mean_or_median=mean_or_median)
-
-    # plot the data: and save figures if needed:
-    # plot Tmrca figure:
-    plot_simulated_data('Tmrca', treetime_pivot, lsd_pivot, beast_pivot,
-        figname="./figs/simdata_Tmrca_TN{}_{}".format(T_over_N, mean_or_median) if SAVE_FIG else None,
-        #plot_idxs=np.array([1,2,4,6,7,9,10])
-        )
+    lsd_pivot = create_pivot_table(lsd_df, T_over_N=T_over_N, mean_or_median=mean_or_median, trim=trim)
+    beast_pivot = create_pivot_table(beast_df, T_over_N=T_over_N, mean_or_median=mean_or_median, trim=trim)
+    treetime_pivot = create_pivot_table(treetime_df, T_over_N=T_over_N, mean_or_median=mean_or_median, trim=trim)
+
+    # convert the pivots to numpy arrays once for both plots
+    lsd_arrays = pivot_to_arrays(lsd_pivot)
+    beast_arrays = pivot_to_arrays(beast_pivot)
+    treetime_arrays = pivot_to_arrays(treetime_pivot)
 
-    # plot Mu figure
-    plot_simulated_data('Mu', treetime_pivot, lsd_pivot, beast_pivot,
-        figname="./figs/simdata_Mu_TN{}_{}".format(T_over_N, mean_or_median) if SAVE_FIG else None,
+    # plot the data: Tmrca and Mu side by side in one figure
+    fig, (ax_tmrca, ax_mu) = plt.subplots(1, 2, figsize=twocolumn_figsize)
+
+    x_shifted = plot_simulated_data('Tmrca', ax_tmrca, treetime_arrays, lsd_arrays, beast_arrays,
         #plot_idxs=np.array([1,2,4,6,7,9,10])
         )
 
+    # both panels share the x axis layout: reuse the shifted point positions
+    plot_simulated_data('Mu', ax_mu, treetime_arrays, lsd_arrays, beast_arrays,
+        #plot_idxs=np.array([1,2,4,6,7,9,10]),
+        x_shifted=x_shifted)
+
+    # save figure if needed:
+    if SAVE_FIG:
+        figname = "./figs/simdata_Tmrca_Mu_TN{}_{}".format(T_over_N, mean_or_median)
+        if trim:
+            figname += "_trim{}".format(trim)
+        for fmt in formats:
+            fig.savefig("{}.{}".format(figname, fmt))
+
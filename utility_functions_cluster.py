@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+This module defines the helpers to submit the runs to the Sun Grid Engine
+cluster, which are shared by the XXX_submit.py scripts.
+"""
+
+import subprocess as sp
+import os
+import time
+
+# stdout/stderr of the cluster jobs. SGE writes them to one file per job in the
+# working directory otherwise; set to a directory path to keep the logs
+JOB_LOG = '/dev/null'
+
+
+def submit_array_job(work_dir, name, params, run_cmd, job_log=None,
+                     h_rt='23:59:0', h_vmem='50G'):
+    """
+    Submit all runs as a single SGE array job.
+
+    The parameters are stored in the index file, one line per task, and every
+    task picks its own line by the $SGE_TASK_ID (1-based). The tasks read the
+    index file when they start, so every submission gets its own files
+    (params_<tag>.tsv and <name>_task_<tag>.sh in the work_dir): re-running
+    the script must not change the parameters of the still queued tasks.
+
+    Args:
+
+     - work_dir(str): directory to store the index file and the task wrapper
+
+     - name(str): name of the task wrapper
+
+     - params(list): parameters of every run, as tuples of values, which
+     should not contain whitespaces
+
+     - run_cmd(str): shell command to run a single task. The parameters of the
+     task are given as the positional arguments "$1", "$2", etc.
+
+     - job_log(str): file or directory for stdout/stderr of the tasks,
+     defaults to JOB_LOG
+
+     - h_rt, h_vmem(str): time and memory limits of every task
+
+    Returns:
+
+     - return code of the qsub call
+    """
+    if job_log is None:
+        job_log = JOB_LOG
+
+    tag = "{}_{}".format(time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+    params_file = os.path.join(work_dir, "params_{}.tsv".format(tag))
+    with open(params_file, 'w') as of:
+        for p in params:
+            of.write("\t".join(map(str, p)) + "\n")
+
+    wrapper = os.path.join(work_dir, "{}_task_{}.sh".format(name, tag))
+    with open(wrapper, 'w') as of:
+        of.write("#!/bin/bash\n")
+        of.write('read -r -a p < <(sed -n "${{SGE_TASK_ID}}p" {})\n'.format(params_file))
+        of.write('set -- "${p[@]}"\n')
+        of.write('exec {}\n'.format(run_cmd))
+
+    call = ['qsub', '-cwd', '-S', '/bin/bash',
+            '-t', '1-%d' % len(params),
+            '-l', 'h_rt=' + h_rt,
+            '-o', job_log,
+            '-e', job_log,
+            '-l', 'h_vmem=' + h_vmem,
+            wrapper]
+    return sp.call(call)
@@ -14,7 +14,7 @@ import os, copy
 import matplotlib.pyplot as plt
 from scipy.stats import linregress
 from collections import Counter
-import StringIO
+from io import StringIO
 import treetime
 from utility_functions_general import remove_polytomies
 from utility_functions_beast import run_beast, create_beast_xml, read_beast_log
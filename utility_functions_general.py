@@ -13,7 +13,7 @@ import datetime
 import os, copy
 from scipy.stats import linregress
 from collections import Counter
-import StringIO
+from io import StringIO
 
 
 def remove_polytomies(tree):
@@ -11,9 +11,15 @@ import numpy as np
 from external_binaries import *
 from utility_functions_general import internal_regress, remove_polytomies, parse_lsd_output
 import subprocess
+import re
 
 NEAREST_DATE = 2016.5
 
+# simulation parameters encoded in the dataset base name:
+# FFpopSim_L<L>_N<N>_Ns<Ns>_Ts<Ts>_Nv<Nv>_Mu<mu>_<suffix>
+_DATASET_NAME_RE = re.compile(
+    r'(?:^|/)[^/_]+_[^/_]+_N(?P<N>\d+)_Ns(?P<Ns>\d+)_Ts(?P<Ts>\d+)_[^/_]+_Mu(?P<Sim_mu>[^/_]+)')
+
 def evolve_seq(treefile, basename, mu=0.0001, L=1000, mygtr = treetime.GTR.standard('jc')):
     """
     Generate a random sequence of a given length, and evolve it on the tree
@@ -30,8 +36,6 @@ def evolve_seq(treefile, basename, mu=0.0001, L=1000, mygtr = treetime.GTR.stand
     from treetime import seq_utils
     from Bio import Phylo, AlignIO
     import numpy as np
-    from itertools import izip
-
     mygtr.mu = mu
     tree = Phylo.read(treefile, 'newick')
     tree.root.ref_seq = np.random.choice(mygtr.alphabet, p=mygtr.Pi, size=L)
@@ -52,7 +56,7 @@ def evolve_seq(treefile, basename, mu=0.0001, L=1000, mygtr = treetime.GTR.stand
         ref_seq_idxs = np.array([int(np.random.choice(np.arange(p.shape[1]), p=p[k])) for k in np.arange(p.shape[0])])
         node.ref_seq = np.array([mygtr.alphabet[k] for k in ref_seq_idxs])
         node.ref_mutations = [(anc, pos, der) for pos, (anc, der) in
-                            enumerate(izip(node.up.ref_seq, node.ref_seq)) if anc!=der]
+                            enumerate(zip(node.up.ref_seq, node.ref_seq)) if anc!=der]
         #print (node.name, len(node.ref_mutations))
         mu_real += 1.0 * (node.ref_seq != node.up.ref_seq).sum() / L
         n_branches += t
@@ -492,6 +496,35 @@ def dates_from_ffpopsim_tree(t):
     except:
         return NEAREST_DATE, {}
 
+def parse_simulation_parameters(df):
+    """
+    Extract the simulation parameters from the names of the simulated datasets,
+    e.g. './simulated_data/dataset/FFpopSim_L10000_N100_Ns20_Ts10_Nv10_Mu1e-05_6'
+
+    Args:
+     - df: Table of results with the dataset names in the 'File' column
+
+    Returns:
+     - df: same table with the 'Sim_mu', 'Ns', 'Ts', 'N', 'T' and 'Nmu' columns added
+    """
+
+    # parse all file names in one pass
+    params = df['File'].str.extract(_DATASET_NAME_RE, expand=True)
+    failed = params.isnull().any(axis=1)
+    if failed.any():
+        raise ValueError("Could not parse the simulation parameters from {} of the "
+                         "file names, e.g. '{}'".format(failed.sum(), df['File'][failed].iloc[0]))
+
+    df['Sim_mu'] = params['Sim_mu'].astype(np.float32)
+    df['Ns'] = params['Ns'].astype(np.int32)
+    df['Ts'] = params['Ts'].astype(np.int32)
+    df['N'] = params['N'].astype(np.int32)
+    df['T'] = df['Ns']*df['Ts']
+    # round to the simulation grid, so that equal N*mu values group together
+    df['Nmu'] = (df['N']*df['Sim_mu']).round(6).astype(np.float32)
+
+    return df
+
 def run_beast(basename, out_dir, res_file, fast_tree=True):
     """
     From basename, compose names for the tree, dates and lignment, and call